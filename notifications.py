@@ -1,24 +1,58 @@
-from typing import List, Dict, Any
-from fastapi import WebSocket
-
-class Notifier:
-    def __init__(self):
-        self.clients: List[WebSocket] = []
-
-    async def connect(self, ws: WebSocket):
-        await ws.accept()
-        self.clients.append(ws)
-
-    def disconnect(self, ws: WebSocket):
-        if ws in self.clients:
-            self.clients.remove(ws)
-
-    async def broadcast(self, payload: Dict[str, Any]):
-        dead = []
-        for c in self.clients:
-            try:
-                await c.send_json(payload)
-            except Exception:
-                dead.append(c)
-        for c in dead:
-            self.disconnect(c)
+import asyncio
+import orjson
+from typing import Dict, Any
+from fastapi import WebSocket
+
+# Limite de mensagens pendentes por cliente; acima disto o cliente é
+# considerado "laggard" e é desligado em vez de bloquear os restantes.
+QUEUE_MAXSIZE = 32
+
+
+class Notifier:
+    def __init__(self):
+        self.clients: Dict[WebSocket, asyncio.Queue] = {}
+        self._relay_tasks: Dict[WebSocket, asyncio.Task] = {}
+
+    async def connect(self, ws: WebSocket):
+        await ws.accept()
+        self.clients[ws] = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+        self._relay_tasks[ws] = asyncio.create_task(self._relay(ws))
+
+    def disconnect(self, ws: WebSocket):
+        self.clients.pop(ws, None)
+        task = self._relay_tasks.pop(ws, None)
+        if task is not None:
+            task.cancel()
+            # fechar o socket para o cliente ver a queda e poder religar
+            asyncio.create_task(self._close(ws))
+
+    async def _close(self, ws: WebSocket):
+        try:
+            await ws.close()
+        except Exception:
+            # já fechado / desligado pelo próprio cliente
+            pass
+
+    async def _relay(self, ws: WebSocket):
+        queue = self.clients[ws]
+        try:
+            while True:
+                text = await queue.get()
+                await ws.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.disconnect(ws)
+
+    async def broadcast(self, payload: Dict[str, Any]):
+        # serializar uma única vez; cada relay envia o mesmo texto
+        text = orjson.dumps(payload).decode()
+        dead = []
+        for ws, queue in self.clients.items():
+            try:
+                queue.put_nowait(text)
+            except asyncio.QueueFull:
+                # cliente demasiado lento: desligar em vez de acumular
+                dead.append(ws)
+        for ws in dead:
+            self.disconnect(ws)